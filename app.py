@@ -1,11 +1,20 @@
 import cv2
 import mediapipe as mp
-import math
+import os
 import time
 import datetime
 import winsound  # Windows Sound System
 import numpy as np
 import csv
+import io
+import wave
+import queue
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+import argparse
+import functools
+import face_engine
 
 # ==========================================
 #        ASTROMIND: MISSION CONFIG
@@ -13,8 +22,54 @@ import csv
 # Thresholds (Tune these for sensitivity)
 EAR_THRESHOLD = 0.20    # Eye Aspect Ratio < 0.20 = Sleeping
 MAR_THRESHOLD = 0.40    # Mouth Aspect Ratio > 0.40 = Yawning
+EAR_T2 = EAR_THRESHOLD ** 2  # Same thresholds on squared ratios (no sqrt in the checks)
+MAR_T2 = MAR_THRESHOLD ** 2
 MICROSLEEP_LIMIT = 15   # Frames before alarm triggers (approx 0.5s)
 EMERGENCY_LIMIT = 100   # Frames before Autopilot triggers (approx 3.5s)
+FRAME_SKIP = 2          # Run FaceMesh every Nth frame, reuse landmarks in between
+WORKER_POLL_S = 0.5     # Max wait on the inference worker before checking it is still alive
+WORKER_START_S = 60     # Max time for the worker to load (and warm up) the face engine
+FRAME_WIDTH = 1280      # Camera resolution
+FRAME_HEIGHT = 720
+CAMERA_FPS = 30         # Frame-count limits above assume ~30 FPS
+CAMERA_FOURCC = "MJPG"  # Compressed camera stream, decoded by OpenCV (cheaper than raw YUY2)
+FOCUS_FLASH_PERIOD = 600 # Frames between "PILOT FOCUS" flashes (approx 20s)
+FOCUS_FLASH_FRAMES = 30  # Frames each flash stays up (approx 1s)
+HISTORY_SIZE = 108000   # EAR/MAR ring buffer length (1 h at 30 FPS)
+REPLAY_BATCH = 16       # Frames per batched inference call in replay mode
+LOG_EVERY_FRAMES = 10   # One black-box row every N frames with a face (~3 rows/s at 30 FPS)
+LOG_ROWS_PER_S = CAMERA_FPS / LOG_EVERY_FRAMES
+LOG_FLUSH_BYTES = 65536 # Cap on rows held in memory; normally written as soon as the queue drains
+LOG_FSYNC_ROWS = int(10 * LOG_ROWS_PER_S)      # fsync every ~10 s of rows (and when idle / at shutdown)
+LOG_IDLE_S = 1.0        # No row for this long (no face) -> fsync what was written
+LOG_ROTATE_ROWS = int(3600 * LOG_ROWS_PER_S)   # New raw log part every ~1 h of rows (~270 KB each)
+INT8_MAX_RMSE = 0.01    # Allowed EAR/MAR error of the INT8 landmark model vs FP32
+USE_OPENCL = False      # Opt-in: mirror + color conversion on the OpenCL device (T-API). Each frame pays a
+                        # full upload + download, so it only pays off on a slow CPU with a fast iGPU
+
+# Landmark Pairs (distance i = A[i] <-> B[i])
+EYE_A, EYE_B = [159, 33], [145, 133]     # Left Eye: Vertical 159-145, Horizontal 33-133
+MOUTH_A, MOUTH_B = [13, 78], [14, 308]   # Mouth:    Vertical 13-14,   Horizontal 78-308
+PAIR_A = EYE_A + MOUTH_A
+PAIR_B = EYE_B + MOUTH_B
+
+# Status Codes (logged as small ints, text is only rendered for the HUD / export)
+STATUS_ONLINE, STATUS_FOCUS, STATUS_CAUTION, STATUS_CRITICAL, STATUS_AUTOPILOT, STATUS_YAWN = range(6)
+STATUS_TEXT = [
+    "SYSTEM: ONLINE",
+    "PILOT FOCUS: EXCELLENT",
+    "CAUTION: EYES CLOSING",
+    "CRITICAL: WAKE UP!",
+    "!!! AUTOPILOT ENGAGED !!!",
+    "FATIGUE DETECTED (YAWN)",
+]
+
+# AI Models (ONNX Runtime is used when both exported models are present)
+DETECTOR_MODEL = "models/face_detection_short_range.onnx"
+LANDMARK_MODEL = "models/face_landmark.onnx"
+
+# Display
+WINDOW_NAME = "Astromind v2.0 - Biometric Sensor"
 
 # Colors (BGR Format)
 CYAN = (255, 255, 0)
@@ -23,220 +78,611 @@ RED = (0, 0, 255)
 ORANGE = (0, 165, 255)
 DARK_GREY = (50, 50, 50)
 
+# Lookup Tables (HUD colors / escalation status indexed directly, no if/elif ladders)
+STATUS_COLORS = [CYAN, NEON_GREEN, ORANGE, RED, NEON_GREEN, ORANGE]  # By status code
+STAGE_STATUS = [STATUS_ONLINE, STATUS_CAUTION, STATUS_CRITICAL, STATUS_AUTOPILOT]
+EAR_COLORS = (RED, NEON_GREEN)      # [ear > EAR_THRESHOLD]
+MAR_COLORS = (ORANGE, NEON_GREEN)   # [mar < MAR_THRESHOLD]
+
+# Wireframe edges as an (K, 2) index array for one-call polyline drawing
+# Sparse contours (~120 segments) instead of the full tesselation (~2500)
+MESH_EDGES = np.array(sorted(mp.solutions.face_mesh.FACEMESH_CONTOURS), dtype=np.int32)
+
 # ==========================================
-#        SYSTEM INITIALIZATION
+#            HELPER FUNCTIONS
 # ==========================================
-print("[SYSTEM] INITIALIZING SENSORS...")
-mp_face_mesh = mp.solutions.face_mesh
-mp_drawing = mp.solutions.drawing_utils
-
-# Initialize AI Model
-face_mesh = mp_face_mesh.FaceMesh(
-    max_num_faces=1,
-    refine_landmarks=True,
-    min_detection_confidence=0.5,
-    min_tracking_confidence=0.5
-)
-
-# Initialize Camera
-cap = cv2.VideoCapture(0)
-cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
-
-# Mission Stats Variables
-start_time = datetime.datetime.now()
-drowsy_counter = 0
-yawn_counter = 0
-total_microsleeps = 0
-total_yawns = 0
-ear_history = []
-mar_history = []
-mission_grade = "A"
-
-# CSV "Black Box" Logger
-log_filename = f"mission_log_{start_time.strftime('%Y%m%d_%H%M%S')}.csv"
-log_file = open(log_filename, mode='w', newline='')
-log_writer = csv.writer(log_file)
-log_writer.writerow(["Timestamp", "EAR", "MAR", "Status", "HeartRate_Sim"])
-
-# Helper Math Function
-def calculate_distance(p1, p2):
-    return math.sqrt((p1.x - p2.x)**2 + (p1.y - p2.y)**2)
-
-print("[SYSTEM] ASTROMIND ONLINE. PRESS 'Q' TO END MISSION.")
+# Helper Math Function (all squared pair distances in one vectorized pass over an (N,3) landmark array)
+# Ratios are compared squared against EAR_T2 / MAR_T2, so no sqrt is needed here
+def calculate_sq_distances(lm, idx_a, idx_b):
+    diff = lm[idx_a, :2] - lm[idx_b, :2]
+    return (diff * diff).sum(axis=1)
+
+# HUD Helper: face wireframe, every edge drawn by a single cv2.polylines call
+def draw_mesh(img, lm, edges, color=(0, 255, 255)):
+    h, w, _ = img.shape
+    px = (lm[:, :2] * (w, h)).astype(np.int32)
+    cv2.polylines(img, px[edges], False, color, 1)
+
+# HUD Helper: 60% color over the frame inside (x1,y1)-(x2,y2), corners inclusive like cv2.rectangle
+def blend_panel(img, x1, y1, x2, y2, color, alpha=0.6):
+    roi = img[y1:y2 + 1, x1:x2 + 1]
+    cv2.addWeighted(roi, 1 - alpha, np.full_like(roi, color), alpha, 0, roi)
+
+# HUD Helper: pen advance of putText (getTextSize pads the width by the thickness)
+def text_advance(text, font, scale, thickness):
+    return cv2.getTextSize(text, font, scale, thickness)[0][0] - thickness
+
+# HUD Helper: static text rendered once into a cropped sprite + mask, then blitted every frame
+@functools.lru_cache(maxsize=None)
+def render_sprite(text, font, scale, color, thickness):
+    (tw, th), base = cv2.getTextSize(text, font, scale, thickness)
+    pad = thickness
+    canvas = np.zeros((th + base + 2 * pad, tw + 2 * pad, 3), dtype=np.uint8)
+    cv2.putText(canvas, text, (pad, th + pad), font, scale, color, thickness)
+    mask = canvas.any(axis=2)
+    ys, xs = np.nonzero(mask)
+    y0, y1, x0, x1 = ys.min(), ys.max() + 1, xs.min(), xs.max() + 1
+    # Offset of the crop from the putText origin (baseline-left), and the text advance
+    offset = (x0 - pad, y0 - th - pad)
+    return canvas[y0:y1, x0:x1], mask[y0:y1, x0:x1], offset, text_advance(text, font, scale, thickness)
+
+def blit_text(img, text, org, font, scale, color, thickness):
+    # Drop-in for cv2.putText with a static string
+    pixels, mask, (dx, dy), _ = render_sprite(text, font, scale, color, thickness)
+    x, y = org[0] + dx, org[1] + dy
+    # Clip to the frame like putText does (small cameras, centered text wider than the frame)
+    h, w = img.shape[:2]
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + mask.shape[1], w), min(y + mask.shape[0], h)
+    if x0 >= x1 or y0 >= y1:
+        return
+    mask = mask[y0 - y:y1 - y, x0 - x:x1 - x]
+    img[y0:y1, x0:x1][mask] = pixels[y0 - y:y1 - y, x0 - x:x1 - x][mask]
+
+def put_label(img, label, value, org, font, scale, color, thickness):
+    # Static label from the sprite cache, only the value is rasterized per frame
+    blit_text(img, label, org, font, scale, color, thickness)
+    advance = render_sprite(label, font, scale, color, thickness)[3]
+    cv2.putText(img, value, (org[0] + advance, org[1]), font, scale, color, thickness)
+
+# Background Logger: keeps file I/O off the frame loop
+# Rows are formatted by hand into a bytearray and written with os.write on a raw O_APPEND fd
+# whenever the queue drains, so a crash loses at most the rows still in flight; every
+# LOG_ROTATE_ROWS rows a new part is started and its name added to raw_parts
+def log_worker(log_queue, raw_log_prefix, raw_parts):
+    buf = bytearray()
+    fd = None
+    rows = 0
+    unsynced = 0
+    while True:
+        try:
+            row = log_queue.get(timeout=LOG_IDLE_S)
+        except queue.Empty:
+            if unsynced:
+                flush_log(fd, buf, sync=True)
+                unsynced = 0
+            continue
+        if row is None:  # Sentinel: mission ended
+            break
+        if rows % LOG_ROTATE_ROWS == 0:
+            if fd is not None:
+                flush_log(fd, buf, sync=True)
+                os.close(fd)
+                unsynced = 0
+            raw_parts.append(f"{raw_log_prefix}.{len(raw_parts):03d}.raw.csv")
+            fd = os.open(raw_parts[-1], os.O_WRONLY | os.O_CREAT | os.O_APPEND | getattr(os, "O_BINARY", 0))
+        t, ear, mar, status, bpm = row
+        buf.extend(f"{t:.3f},{ear:.3f},{mar:.3f},{status},{bpm}\n".encode())
+        rows += 1
+        unsynced += 1
+        if unsynced >= LOG_FSYNC_ROWS:
+            flush_log(fd, buf, sync=True)
+            unsynced = 0
+        elif log_queue.empty() or len(buf) >= LOG_FLUSH_BYTES:
+            flush_log(fd, buf)
+    if fd is not None:
+        flush_log(fd, buf, sync=True)
+        os.close(fd)
+
+def flush_log(fd, buf, sync=False):
+    if buf:
+        os.write(fd, buf)
+        buf.clear()
+    if sync:
+        os.fsync(fd)
+
+def export_log(raw_parts, log_filename, start_time):
+    # Raw rows (all rotated parts, in order) -> human-readable CSV (wall-clock timestamps, status text)
+    with open(log_filename, mode='w', newline='') as dst:
+        writer = csv.writer(dst)
+        writer.writerow(["Timestamp", "EAR", "MAR", "Status", "HeartRate_Sim"])
+        for raw_log_filename in raw_parts:
+            with open(raw_log_filename, newline='') as src:
+                for t, ear, mar, status, bpm in csv.reader(src):
+                    ts = start_time + datetime.timedelta(seconds=float(t))
+                    writer.writerow([ts, ear, mar, STATUS_TEXT[int(status)], bpm])
+            os.remove(raw_log_filename)
+
+# Alarm Tones: sine-wave WAVs synthesized once in memory
+def synth_beep(freq, duration_ms, rate=22050):
+    t = np.arange(int(rate * duration_ms / 1000)) / rate
+    samples = (np.sin(2 * np.pi * freq * t) * 0.8 * 32767).astype(np.int16)
+    buf = io.BytesIO()
+    with wave.open(buf, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(samples.tobytes())
+    return buf.getvalue()
+
+# Alarm Player: winsound can't play SND_MEMORY with SND_ASYNC, so a worker plays it instead
+def alarm_worker(alarm_queue):
+    while True:
+        wav = alarm_queue.get()
+        winsound.PlaySound(wav, winsound.SND_MEMORY | winsound.SND_NODEFAULT)
+
+def play_alarm(alarm_queue, wav):
+    try:
+        alarm_queue.put_nowait(wav)
+    except queue.Full:
+        pass  # A tone is already pending, skip rather than block
+
+# Display Swap Slot: triple buffering (main loop draws, one frame waits, display thread shows)
+# Frames are dropped, never queued, and no buffer is ever written while it is on screen
+class DisplaySlot:
+    def __init__(self, shape):
+        self.lock = threading.Lock()
+        self.pending = np.zeros(shape, dtype=np.uint8)
+        self.fresh = False
+
+    def publish(self, image):
+        # Hand over a finished frame, get back a buffer the display thread is not using
+        with self.lock:
+            image, self.pending = self.pending, image
+            self.fresh = True
+        return image
+
+    def take(self, shown):
+        # Swap the buffer just shown for the newest frame, None when nothing new arrived
+        with self.lock:
+            if not self.fresh:
+                return None
+            shown, self.pending = self.pending, shown
+            self.fresh = False
+        return shown
+
+# Display Thread: imshow (a blocking GDI blit on Windows) off the frame loop, 'q' sets quit_event
+def display_worker(display_slot, quit_event):
+    shown = np.zeros_like(display_slot.pending)
+    while not quit_event.is_set():
+        frame = display_slot.take(shown)
+        if frame is None:
+            key = cv2.waitKey(1)  # Nothing new, pump window events without spinning
+        else:
+            shown = frame
+            cv2.imshow(WINDOW_NAME, shown)
+            key = cv2.pollKey()
+        if key & 0xFF == ord('q'):
+            quit_event.set()
+    cv2.destroyAllWindows()  # HighGUI windows belong to the thread that created them
+
+# Worker Handshake: bounded semaphore waits, a dead inference worker must never freeze the monitor
+def wait_for_worker(semaphore, worker):
+    while not semaphore.acquire(timeout=WORKER_POLL_S):
+        if not worker.is_alive():
+            return False
+    return True
+
+# Mission Report: written on every exit once the mission started, aborted missions say why
+def write_report(start_time, total_microsleeps, total_yawns, avg_ear, abort_reason=None):
+    end_time = datetime.datetime.now()
+    duration = end_time - start_time
+
+    # Grading Logic
+    if total_microsleeps == 0 and total_yawns < 2: mission_grade = "S (PERFECT)"
+    elif total_microsleeps < 3: mission_grade = "A (SAFE)"
+    elif total_microsleeps < 6: mission_grade = "C (CAUTION)"
+    else: mission_grade = "F (DANGEROUS)"
+
+    report_name = f"Mission_Report_{end_time.strftime('%Y%m%d_%H%M%S')}.txt"
+    with open(report_name, "w") as f:
+        f.write("==================================================\n")
+        f.write("      ASTROMIND: FLIGHT RECORDER LOG (SECURE)     \n")
+        f.write("==================================================\n")
+        if abort_reason:
+            f.write(f"*** MISSION ABORTED: {abort_reason} ***\n")
+        f.write(f"DATE:         {end_time.strftime('%Y-%m-%d')}\n")
+        f.write(f"DURATION:     {str(duration).split('.')[0]}\n")
+        f.write(f"FINAL GRADE:  {mission_grade}\n")
+        f.write("--------------------------------------------------\n")
+        f.write(f"TOTAL MICROSLEEPS: {total_microsleeps}\n")
+        f.write(f"TOTAL YAWNS:       {total_yawns}\n")
+        f.write(f"AVG EYE OPENNESS:  {avg_ear:.3f}\n")
+        f.write("==================================================\n")
+    return report_name
 
 # ==========================================
-#          MAIN MISSION LOOP
+#      POST-HOC ANALYSIS (REPLAY MODE)
 # ==========================================
-while cap.isOpened():
-    success, image = cap.read()
-    if not success:
-        continue
-
-    # Flip image for "Mirror" view
-    image = cv2.flip(image, 1)
-    h, w, _ = image.shape
-    overlay = image.copy() # For transparent HUD
-
-    # Process AI Mesh
-    image.flags.writeable = False
-    rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-    results = face_mesh.process(rgb_image)
-    image.flags.writeable = True
-
-    # Default Status
-    status_text = "SYSTEM: ONLINE"
-    status_color = CYAN
-    ear = 0.0
-    mar = 0.0
-
-    if results.multi_face_landmarks:
-        for face_landmarks in results.multi_face_landmarks:
-            lm = face_landmarks.landmark
-
-            # --- 1. BIOMETRIC CALCULATIONS ---
-            # Eye Aspect Ratio (Left Eye)
-            # Vertical points: 159-145, Horizontal: 33-133
-            left_eye_v = calculate_distance(lm[159], lm[145])
-            left_eye_h = calculate_distance(lm[33], lm[133])
-            ear = left_eye_v / left_eye_h
-            ear_history.append(ear)
-
-            # Mouth Aspect Ratio (Yawning)
-            # Vertical: 13-14, Horizontal: 78-308
-            mouth_v = calculate_distance(lm[13], lm[14])
-            mouth_h = calculate_distance(lm[78], lm[308])
-            mar = mouth_v / mouth_h
-            mar_history.append(mar)
-
-            # --- 2. DRAW MESH (Tactical Wireframe) ---
-            mp_drawing.draw_landmarks(
-                image=image,
-                landmark_list=face_landmarks,
-                connections=mp_face_mesh.FACEMESH_TESSELATION,
-                landmark_drawing_spec=None,
-                connection_drawing_spec=mp_drawing.DrawingSpec(color=(0, 255, 255), thickness=1, circle_radius=0)
-            )
-
-            # --- 3. SAFETY LOGIC & ESCALATION ---
-            
-            # Check Eyes (Drowsiness)
-            if ear < EAR_THRESHOLD:
-                drowsy_counter += 1
+def calculate_ratios(lm):
+    d2 = calculate_sq_distances(lm, PAIR_A, PAIR_B)
+    return np.sqrt((d2[0] / d2[1], d2[2] / d2[3]))  # EAR, MAR
+
+def read_batches(path, rgb):
+    # Mirrored frames of a recorded session, REPLAY_BATCH at a time in one (N,H,W,3) buffer
+    video = cv2.VideoCapture(path)
+    while True:
+        frames = []
+        while len(frames) < REPLAY_BATCH:
+            ok, frame = video.read()
+            if not ok:
+                break
+            frame = cv2.flip(frame, 1)
+            frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) if rgb else frame)
+        if not frames:
+            break
+        yield np.stack(frames)
+    video.release()
+
+def run_replay(face_mesh, path):
+    use_onnx = isinstance(face_mesh, face_engine.OnnxFaceMesh)
+    if use_onnx:
+        face_mesh.warmup(batch_sizes=(REPLAY_BATCH,))
+    probe = cv2.VideoCapture(path)  # Frames come from read_batches, this one only reads the FPS
+    fps = probe.get(cv2.CAP_PROP_FPS) or 30.0
+    probe.release()
+    replay_log = f"replay_log_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+
+    frame_no = face_frames = drowsy = yawn = microsleeps = yawns = 0
+    ear_sum = 0.0
+    with open(replay_log, mode='w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["Frame", "Time_s", "EAR", "MAR"])
+
+        # ONNX engine swaps channels during its own crop preprocessing
+        for batch in read_batches(path, rgb=not use_onnx):
+            # Legacy FaceMesh (TFLite) only supports batch=1
+            if use_onnx:
+                batch_landmarks = face_mesh.process_batch(batch, bgr=True)
             else:
-                drowsy_counter = 0 # Reset if eyes open
+                batch_landmarks = [face_engine.first_face(face_mesh.process(frame)) for frame in batch]
+
+            for lm in batch_landmarks:
+                if lm is not None:
+                    ear, mar = calculate_ratios(lm)
+                    drowsy = drowsy + 1 if ear < EAR_THRESHOLD else 0
+                    yawn = yawn + 1 if mar > MAR_THRESHOLD else 0
+                    if drowsy == MICROSLEEP_LIMIT: microsleeps += 1
+                    if yawn == 15: yawns += 1
+                    ear_sum += ear
+                    face_frames += 1
+                    writer.writerow([frame_no, f"{frame_no / fps:.3f}", f"{ear:.3f}", f"{mar:.3f}"])
+                frame_no += 1
+
+    avg_ear = ear_sum / face_frames if face_frames else 0
+    print(f"[REPLAY] {frame_no} FRAMES ANALYZED | MICROSLEEPS: {microsleeps} | YAWNS: {yawns} | AVG EYE OPENNESS: {avg_ear:.3f}")
+    print(f"[REPLAY] Log saved to {replay_log}")
+
+def validate_int8(path):
+    # EAR/MAR drift of the INT8 landmark model against FP32 on a held-out clip
+    fp32 = face_engine.OnnxFaceMesh(DETECTOR_MODEL, LANDMARK_MODEL, int8=False)
+    int8 = face_engine.OnnxFaceMesh(DETECTOR_MODEL, LANDMARK_MODEL, int8=True)
+    errors = []
+    for batch in read_batches(path, rgb=False):
+        for a, b in zip(fp32.process_batch(batch, bgr=True), int8.process_batch(batch, bgr=True)):
+            if a is not None and b is not None:
+                errors.append(np.subtract(calculate_ratios(a), calculate_ratios(b)))
+    if not errors:
+        print("[INT8] NO FACE FOUND IN CLIP.")
+        return
+    ear_rmse, mar_rmse = np.sqrt(np.mean(np.square(errors), axis=0))
+    passed = max(ear_rmse, mar_rmse) < INT8_MAX_RMSE
+    summary = f"{len(errors)} FRAMES | EAR RMSE: {ear_rmse:.4f} | MAR RMSE: {mar_rmse:.4f}"
+    # Only a passing run enables the INT8 model, a failing one disables it again
+    face_engine.record_int8_validation(LANDMARK_MODEL, passed and f"{path} | {summary}")
+    print(f"[INT8] {summary} | {'PASS' if passed else 'FAIL'}")
 
-            # Check Mouth (Yawning)
-            if mar > MAR_THRESHOLD:
-                yawn_counter += 1
+# ==========================================
+#        SYSTEM INITIALIZATION
+# ==========================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Astromind Biometric Crew Monitor")
+    parser.add_argument("--replay", metavar="PATH", help="Analyze a recorded session video instead of the live camera")
+    parser.add_argument("--dynamic-batch", action="store_true", help="Rewrite the ONNX models with a dynamic batch axis")
+    parser.add_argument("--quantize", action="store_true", help="Write an INT8 copy of the ONNX landmark model")
+    parser.add_argument("--validate-int8", metavar="PATH", help="Compare INT8 vs FP32 EAR/MAR on a recorded clip")
+    args = parser.parse_args()
+
+    if args.dynamic_batch:
+        for path in (DETECTOR_MODEL, LANDMARK_MODEL):
+            face_engine.make_batch_dynamic(path)
+            print(f"[SYSTEM] DYNAMIC BATCH AXIS WRITTEN TO {path}")
+        raise SystemExit
+    if args.quantize:
+        print(f"[SYSTEM] INT8 MODEL SAVED TO {face_engine.quantize_landmark_model(LANDMARK_MODEL)}")
+        raise SystemExit
+    if args.validate_int8:
+        validate_int8(args.validate_int8)
+        raise SystemExit
+
+    print("[SYSTEM] INITIALIZING SENSORS...")
+    use_onnx = face_engine.onnx_available(DETECTOR_MODEL, LANDMARK_MODEL)
+    if use_onnx:
+        print("[SYSTEM] ONNX RUNTIME ENGINE SELECTED.")
+
+    # The ONNX engine swaps channels on its own crop, leaving only the flip for the device
+    use_ocl = USE_OPENCL and not use_onnx and cv2.ocl.haveOpenCL()
+    cv2.ocl.setUseOpenCL(use_ocl)
+    if use_ocl:
+        print("[SYSTEM] OPENCL ACCELERATION ENABLED.")
+
+    if args.replay:
+        run_replay(face_engine.create_face_mesh(DETECTOR_MODEL, LANDMARK_MODEL), args.replay)
+        raise SystemExit
+
+    # Initialize Camera (Media Foundation backend, default backend as fallback)
+    cap = cv2.VideoCapture(0, cv2.CAP_MSMF)
+    if not cap.isOpened():
+        cap = cv2.VideoCapture(0)
+    cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*CAMERA_FOURCC))
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, FRAME_WIDTH)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, FRAME_HEIGHT)
+    cap.set(cv2.CAP_PROP_FPS, CAMERA_FPS)
+
+    # Buffers are sized from a real frame, the driver may not honor the requested size
+    success, frame = cap.read()
+    if not success:
+        raise SystemExit("[ERROR] CAMERA DELIVERED NO FRAME.")
+    frame_h, frame_w, _ = frame.shape
+    fourcc = int(cap.get(cv2.CAP_PROP_FOURCC)).to_bytes(4, "little").decode(errors="replace")
+    print(f"[SYSTEM] CAMERA: {frame_w}x{frame_h} @ {cap.get(cv2.CAP_PROP_FPS):.0f} FPS ({fourcc})")
+
+    # Persistent Frame Buffers (reused every frame instead of reallocated)
+    image = np.empty_like(frame)
+
+    # Inference Worker Process (frames in / landmarks out through shared memory)
+    frame_shm = shared_memory.SharedMemory(create=True, size=frame.nbytes)
+    result_shm = shared_memory.SharedMemory(create=True, size=face_engine.RESULT_BYTES)
+    shm_frame = np.ndarray(frame.shape, dtype=np.uint8, buffer=frame_shm.buf)
+    shm_result = np.ndarray(face_engine.RESULT_SHAPE, dtype=np.float32, buffer=result_shm.buf)
+    frame_ready = multiprocessing.Semaphore(0)
+    result_ready = multiprocessing.Semaphore(0)
+    worker_ready = multiprocessing.Event()  # Set once the engine is loaded and warmed up
+    stop_event = multiprocessing.Event()
+    worker = multiprocessing.Process(
+        target=face_engine.inference_worker,
+        args=(frame_shm.name, result_shm.name, frame.shape, frame_ready, result_ready,
+              worker_ready, stop_event, DETECTOR_MODEL, LANDMARK_MODEL),
+        daemon=True
+    )
+    worker.start()
+    log_thread = display_thread = None  # Started once the engine is up, cleanup checks them
+    abort_reason = "MISSION LOOP INTERRUPTED"  # Kept if an exception / Ctrl+C unwinds the loop
+    try:
+        print("[SYSTEM] WARMING UP FACE ENGINE...")
+        # Keep engine warmup out of the mission clock, and never go ONLINE without an engine
+        startup_deadline = time.monotonic() + WORKER_START_S
+        while not worker_ready.wait(WORKER_POLL_S):
+            if worker.is_alive() and time.monotonic() < startup_deadline:
+                continue
+            reason = f"DIED (EXIT CODE {worker.exitcode})" if not worker.is_alive() else f"NOT READY AFTER {WORKER_START_S}s"
+            raise SystemExit(f"[ERROR] FACE ENGINE {reason}. MISSION ABORTED.")
+
+        # Mission Stats Variables
+        start_time = datetime.datetime.now()
+        t0_mono = time.monotonic()  # Per-frame clock, wall time is only derived for the export
+        drowsy_counter = 0
+        yawn_counter = 0
+        total_microsleeps = 0
+        total_yawns = 0
+        ear_history = np.empty(HISTORY_SIZE, dtype=np.float32)  # Fixed ring buffers, constant memory
+        mar_history = np.empty(HISTORY_SIZE, dtype=np.float32)
+        history_n = 0
+        ear_sum = 0.0
+        frame_idx = 0
+        landmarks = None  # Last (N,3) landmark array, reused on skipped frames
+        in_flight = False  # A frame is with the inference worker
+
+        # CSV "Black Box" Logger (raw numeric rows in flight, human-readable export at shutdown)
+        log_filename = f"mission_log_{start_time.strftime('%Y%m%d_%H%M%S')}.csv"
+        raw_log_prefix = f"mission_log_{start_time.strftime('%Y%m%d_%H%M%S')}"
+        raw_parts = []  # Rotated raw files, filled in by the logger thread
+
+        log_queue = queue.Queue(maxsize=1024)
+        log_thread = threading.Thread(target=log_worker, args=(log_queue, raw_log_prefix, raw_parts), daemon=True)
+        log_thread.start()
+
+        # Alarm Tones + Player
+        BEEP_WARNING = synth_beep(1000, 100)
+        BEEP_EMERGENCY = synth_beep(2000, 500)
+        alarm_queue = queue.Queue(maxsize=1)
+        threading.Thread(target=alarm_worker, args=(alarm_queue,), daemon=True).start()
+
+        # Display Thread
+        display_slot = DisplaySlot(frame.shape)
+        quit_event = threading.Event()
+        display_thread = threading.Thread(target=display_worker, args=(display_slot, quit_event), daemon=True)
+        display_thread.start()
+
+        print("[SYSTEM] ASTROMIND ONLINE. PRESS 'Q' TO END MISSION.")
+
+        # ==========================================
+        #          MAIN MISSION LOOP
+        # ==========================================
+        while cap.isOpened():
+            success, frame = cap.read(frame)
+            if not success:
+                continue
+
+            # Flip image for "Mirror" view
+            if use_ocl:
+                u_image = cv2.flip(cv2.UMat(frame), 1)
+                image = u_image.get()  # HUD sprites + display need host memory
             else:
-                yawn_counter = 0
-            
-            # Count Events (Only once per trigger)
-            if drowsy_counter == MICROSLEEP_LIMIT: total_microsleeps += 1
-            if yawn_counter == 15: total_yawns += 1
-
-            # --- ALARM STAGES ---
-            # STAGE 0: Praise (Good Focus)
-            if ear > 0.25 and mar < 0.2 and drowsy_counter == 0:
-                 if int(time.time()) % 20 == 0: # Flash every 20s
-                     status_text = "PILOT FOCUS: EXCELLENT"
-                     status_color = NEON_GREEN
-
-            # STAGE 1: Caution (Yellow)
-            if drowsy_counter > 5 and drowsy_counter < MICROSLEEP_LIMIT:
-                status_text = "CAUTION: EYES CLOSING"
-                status_color = ORANGE
-
-            # STAGE 2: Critical Alarm (Red)
-            elif drowsy_counter >= MICROSLEEP_LIMIT and drowsy_counter < EMERGENCY_LIMIT:
-                status_text = "CRITICAL: WAKE UP!"
-                status_color = RED
-                # Non-blocking beep trick (short duration)
-                if drowsy_counter % 5 == 0: winsound.Beep(1000, 100)
-
-            # STAGE 3: Emergency Autopilot (Dead Man's Switch)
-            elif drowsy_counter >= EMERGENCY_LIMIT:
-                status_text = "!!! AUTOPILOT ENGAGED !!!"
-                status_color = NEON_GREEN
-                # Simulation of taking control
-                cv2.putText(image, "PILOT UNRESPONSIVE", (w//2 - 250, h//2), 
-                            cv2.FONT_HERSHEY_SIMPLEX, 1.5, RED, 3)
-                if drowsy_counter % 30 == 0: winsound.Beep(2000, 500)
-
-            # Yawn Warning
-            if yawn_counter > 10 and drowsy_counter < MICROSLEEP_LIMIT:
-                status_text = "FATIGUE DETECTED (YAWN)"
-                status_color = ORANGE
-
-            # --- 4. DATA LOGGING (Black Box) ---
-            # Save data every 10 frames
-            bpm = 70 + (int(time.time() * 2) % 15) # Simulated Heart Rate
-            if int(time.time() * 10) % 10 == 0:
-                log_writer.writerow([datetime.datetime.now(), f"{ear:.3f}", f"{mar:.3f}", status_text, bpm])
-
-    # ==========================================
-    #            UI RENDER (THE HUD)
-    # ==========================================
-    # 1. Semi-Transparent Panels
-    cv2.rectangle(overlay, (10, 10), (320, 160), DARK_GREY, -1)     # Top Left
-    cv2.rectangle(overlay, (w-280, 10), (w-10, 200), DARK_GREY, -1) # Top Right
-    cv2.rectangle(overlay, (0, h-40), (w, h), (0, 0, 0), -1)        # Bottom Bar
-    
-    # Apply Transparency
-    cv2.addWeighted(overlay, 0.6, image, 0.4, 0, image)
-
-    # 2. Left Panel (System Status)
-    cv2.putText(image, status_text, (20, 50), cv2.FONT_HERSHEY_SIMPLEX, 0.7, status_color, 2)
-    cv2.putText(image, f"FATIGUE EVENTS: {total_microsleeps}", (20, 90), cv2.FONT_HERSHEY_PLAIN, 1.2, (200,200,200), 1)
-    cv2.putText(image, f"YAWN COUNT:     {total_yawns}", (20, 120), cv2.FONT_HERSHEY_PLAIN, 1.2, (200,200,200), 1)
-
-    # 3. Right Panel (Biometrics)
-    cv2.putText(image, "BIO-TELEMETRY", (w-260, 40), cv2.FONT_HERSHEY_SIMPLEX, 0.5, CYAN, 1)
-    cv2.putText(image, f"EYE OPEN: {ear:.2f}", (w-260, 80), cv2.FONT_HERSHEY_PLAIN, 1.5, NEON_GREEN if ear > EAR_THRESHOLD else RED, 1)
-    cv2.putText(image, f"MOUTH:    {mar:.2f}", (w-260, 110), cv2.FONT_HERSHEY_PLAIN, 1.5, NEON_GREEN if mar < MAR_THRESHOLD else ORANGE, 1)
-    cv2.putText(image, f"HR:       {bpm} BPM", (w-260, 150), cv2.FONT_HERSHEY_PLAIN, 1.5, RED, 1)
-
-    # 4. Footer (Mission Time)
-    duration = str(datetime.datetime.now() - start_time).split('.')[0]
-    cv2.putText(image, f"MISSION TIME: {duration} | ASTROMIND SENSOR V2.0", (20, h-12), cv2.FONT_HERSHEY_PLAIN, 1, CYAN, 1)
-
-    cv2.imshow('Astromind v2.0 - Biometric Sensor', image)
-
-    # --- QUIT & GENERATE REPORT ---
-    key = cv2.waitKey(5) & 0xFF
-    if key == ord('q'):
-        # Calculate Final Stats
-        end_time = datetime.datetime.now()
-        duration = end_time - start_time
-        avg_ear = sum(ear_history) / len(ear_history) if ear_history else 0
-        
-        # Grading Logic
-        if total_microsleeps == 0 and total_yawns < 2: mission_grade = "S (PERFECT)"
-        elif total_microsleeps < 3: mission_grade = "A (SAFE)"
-        elif total_microsleeps < 6: mission_grade = "C (CAUTION)"
-        else: mission_grade = "F (DANGEROUS)"
-
-        # Write Report
-        report_name = f"Mission_Report_{end_time.strftime('%Y%m%d_%H%M%S')}.txt"
-        with open(report_name, "w") as f:
-            f.write("==================================================\n")
-            f.write("      ASTROMIND: FLIGHT RECORDER LOG (SECURE)     \n")
-            f.write("==================================================\n")
-            f.write(f"DATE:         {end_time.strftime('%Y-%m-%d')}\n")
-            f.write(f"DURATION:     {str(duration).split('.')[0]}\n")
-            f.write(f"FINAL GRADE:  {mission_grade}\n")
-            f.write("--------------------------------------------------\n")
-            f.write(f"TOTAL MICROSLEEPS: {total_microsleeps}\n")
-            f.write(f"TOTAL YAWNS:       {total_yawns}\n")
-            f.write(f"AVG EYE OPENNESS:  {avg_ear:.3f}\n")
-            f.write("==================================================\n")
-        
-        print(f"\n[MISSION COMPLETE] Log saved to {log_filename}")
-        print(f"[MISSION COMPLETE] Report saved to {report_name}")
-        break
-
-# Cleanup
-cap.release()
-log_file.close()
-cv2.destroyAllWindows()
\ No newline at end of file
+                image = cv2.flip(frame, 1, dst=image)
+            h, w, _ = image.shape
+
+            # Process AI Mesh (every FRAME_SKIP frames, landmarks reused in between)
+            # Pipelined: collect the worker's landmarks for the previous frame, then hand it this one
+            if frame_idx % FRAME_SKIP == 0:
+                if in_flight:
+                    if not wait_for_worker(result_ready, worker):
+                        abort_reason = f"INFERENCE WORKER DIED (EXIT CODE {worker.exitcode})"
+                        print(f"\n[ERROR] {abort_reason}. ABORTING MISSION.")
+                        break
+                    n = int(shm_result[0, 0])
+                    landmarks = shm_result[1:n + 1].copy() if n else None
+                if use_onnx:
+                    # BGR->RGB + resize + normalize fused into one pass over the face crop (worker side)
+                    np.copyto(shm_frame, image)
+                elif use_ocl:
+                    np.copyto(shm_frame, cv2.cvtColor(u_image, cv2.COLOR_BGR2RGB).get())
+                else:
+                    cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=shm_frame)
+                frame_ready.release()
+                in_flight = True
+            frame_idx += 1
+
+            # Default Status
+            status = STATUS_ONLINE
+            ear = 0.0
+            mar = 0.0
+            bpm = 70 + (frame_idx // 15) % 15 # Simulated Heart Rate
+
+            if landmarks is not None:
+                # --- 1. BIOMETRIC CALCULATIONS ---
+                # Squared [eye_v, eye_h, mouth_v, mouth_h]
+                d2 = calculate_sq_distances(landmarks, PAIR_A, PAIR_B)
+
+                # Eye Aspect Ratio (Left Eye), squared
+                ear2 = d2[0] / d2[1]
+
+                # Mouth Aspect Ratio (Yawning), squared
+                mar2 = d2[2] / d2[3]
+
+                # Plain ratios only for the HUD, history and log (one sqrt each per frame)
+                ear, mar = ear2 ** 0.5, mar2 ** 0.5
+
+                # Ring buffer + running sum for the mission report
+                ear_history[history_n % HISTORY_SIZE] = ear
+                mar_history[history_n % HISTORY_SIZE] = mar
+                history_n += 1
+                ear_sum += ear
+
+                # --- 2. DRAW MESH (Tactical Wireframe) ---
+                draw_mesh(image, landmarks, MESH_EDGES)
+
+                # --- 3. SAFETY LOGIC & ESCALATION ---
+
+                # Check Eyes (Drowsiness)
+                if ear2 < EAR_T2:
+                    drowsy_counter += 1
+                else:
+                    drowsy_counter = 0 # Reset if eyes open
+
+                # Check Mouth (Yawning)
+                if mar2 > MAR_T2:
+                    yawn_counter += 1
+                else:
+                    yawn_counter = 0
+
+                # Count Events (Only once per trigger)
+                if drowsy_counter == MICROSLEEP_LIMIT: total_microsleeps += 1
+                if yawn_counter == 15: total_yawns += 1
+
+                # --- ALARM STAGES ---
+                # Escalation stage straight from the counter: 0 none, 1 caution, 2 critical, 3 autopilot
+                stage = (drowsy_counter > 5) + (drowsy_counter >= MICROSLEEP_LIMIT) + (drowsy_counter >= EMERGENCY_LIMIT)
+                status = STAGE_STATUS[stage]
+
+                # STAGE 0: Praise (Good Focus)
+                if ear > 0.25 and mar < 0.2 and drowsy_counter == 0:
+                     if frame_idx % FOCUS_FLASH_PERIOD < FOCUS_FLASH_FRAMES: # Flash every 20s
+                         status = STATUS_FOCUS
+
+                # STAGE 2: Critical Alarm (Red)
+                if stage == 2:
+                    # Non-blocking beep trick (short duration)
+                    if drowsy_counter % 5 == 0: play_alarm(alarm_queue, BEEP_WARNING)
+
+                # STAGE 3: Emergency Autopilot (Dead Man's Switch)
+                elif stage == 3:
+                    # Simulation of taking control
+                    blit_text(image, "PILOT UNRESPONSIVE", (w//2 - 250, h//2),
+                              cv2.FONT_HERSHEY_SIMPLEX, 1.5, RED, 3)
+                    if drowsy_counter % 30 == 0: play_alarm(alarm_queue, BEEP_EMERGENCY)
+
+                # Yawn Warning
+                if yawn_counter > 10 and stage < 2:
+                    status = STATUS_YAWN
+
+                # --- 4. DATA LOGGING (Black Box) ---
+                # Save data every LOG_EVERY_FRAMES frames
+                if frame_idx % LOG_EVERY_FRAMES == 0:
+                    try:
+                        log_queue.put_nowait((time.monotonic() - t0_mono, ear, mar, status, bpm))
+                    except queue.Full:
+                        pass  # Drop the sample rather than stall the frame loop
+
+            # ==========================================
+            #            UI RENDER (THE HUD)
+            # ==========================================
+            # 1. Semi-Transparent Panels (blended in place, only the panel pixels are touched)
+            blend_panel(image, 10, 10, 320, 160, DARK_GREY)       # Top Left
+            blend_panel(image, w-280, 10, w-10, 200, DARK_GREY)   # Top Right
+            blend_panel(image, 0, h-40, w, h, (0, 0, 0))          # Bottom Bar
+
+            # 2. Left Panel (System Status)
+            blit_text(image, STATUS_TEXT[status], (20, 50), cv2.FONT_HERSHEY_SIMPLEX, 0.7, STATUS_COLORS[status], 2)
+            put_label(image, "FATIGUE EVENTS: ", str(total_microsleeps), (20, 90), cv2.FONT_HERSHEY_PLAIN, 1.2, (200,200,200), 1)
+            put_label(image, "YAWN COUNT:     ", str(total_yawns), (20, 120), cv2.FONT_HERSHEY_PLAIN, 1.2, (200,200,200), 1)
+
+            # 3. Right Panel (Biometrics)
+            blit_text(image, "BIO-TELEMETRY", (w-260, 40), cv2.FONT_HERSHEY_SIMPLEX, 0.5, CYAN, 1)
+            put_label(image, "EYE OPEN: ", f"{ear:.2f}", (w-260, 80), cv2.FONT_HERSHEY_PLAIN, 1.5, EAR_COLORS[int(ear > EAR_THRESHOLD)], 1)
+            put_label(image, "MOUTH:    ", f"{mar:.2f}", (w-260, 110), cv2.FONT_HERSHEY_PLAIN, 1.5, MAR_COLORS[int(mar < MAR_THRESHOLD)], 1)
+            put_label(image, "HR:       ", f"{bpm} BPM", (w-260, 150), cv2.FONT_HERSHEY_PLAIN, 1.5, RED, 1)
+
+            # 4. Footer (Mission Time)
+            duration = datetime.timedelta(seconds=int(time.monotonic() - t0_mono))
+            put_label(image, "MISSION TIME: ", str(duration), (20, h-12), cv2.FONT_HERSHEY_PLAIN, 1, CYAN, 1)
+            footer_x = 20 + text_advance(f"MISSION TIME: {duration}", cv2.FONT_HERSHEY_PLAIN, 1, 1)
+            blit_text(image, " | ASTROMIND SENSOR V2.0", (footer_x, h-12), cv2.FONT_HERSHEY_PLAIN, 1, CYAN, 1)
+
+            image = display_slot.publish(image)
+
+            # --- QUIT (report + export run in the cleanup below) ---
+            if quit_event.is_set():
+                abort_reason = None
+                break
+        else:
+            abort_reason = "CAMERA STREAM CLOSED"
+
+    finally:
+        # Cleanup: runs on quit, abort, exception and Ctrl+C alike, so the black box is always exported
+        cap.release()
+        if display_thread is not None:
+            quit_event.set()
+            display_thread.join()
+        stop_event.set()
+        frame_ready.release()
+        worker.join(timeout=2)
+        if worker.is_alive():
+            worker.terminate()
+        del shm_frame, shm_result  # Views must go before the segments can close
+        frame_shm.close()
+        frame_shm.unlink()
+        result_shm.close()
+        result_shm.unlink()
+        if log_thread is not None:
+            report_name = write_report(start_time, total_microsleeps, total_yawns,
+                                       ear_sum / max(history_n, 1), abort_reason)
+            log_queue.put(None)
+            log_thread.join()
+            export_log(raw_parts, log_filename, start_time)
+            outcome = "MISSION ABORTED" if abort_reason else "MISSION COMPLETE"
+            print(f"\n[{outcome}] Log saved to {log_filename}")
+            print(f"[{outcome}] Report saved to {report_name}")
+
+    if abort_reason:
+        raise SystemExit(1)
@@ -0,0 +1,351 @@
+import os
+from multiprocessing import shared_memory
+
+import cv2
+import mediapipe as mp
+import numpy as np
+
+try:
+    import onnxruntime as ort
+except ImportError:  # Optional accelerator, MediaPipe is used instead
+    ort = None
+
+# ==========================================
+#     ASTROMIND: ONNX RUNTIME FACE ENGINE
+# ==========================================
+# Runs the MediaPipe BlazeFace detector + FaceMesh landmark graphs (exported
+# from TFLite to ONNX) through ONNX Runtime with full graph optimizations.
+# Landmarks come back as plain (468,3) arrays (track / process_batch), the
+# same layout first_face() makes out of stock FaceMesh results.
+
+DETECTOR_SIZE = 128     # BlazeFace short-range input (128x128)
+LANDMARK_SIZE = 192     # FaceMesh landmark input (192x192)
+NUM_LANDMARKS = 468
+ROI_SCALE = 1.5         # Crop margin around the face (MediaPipe default)
+WARMUP_RUNS = 10        # Dummy inferences before the mission (cuDNN algo search, allocator growth)
+
+# CUDA first (heuristic cuDNN algo pick instead of exhaustive autotune), CPU fallback
+PROVIDERS = (("CUDAExecutionProvider", {"cudnn_conv_algo_search": "HEURISTIC"}),
+             "CPUExecutionProvider")
+
+MAX_LANDMARKS = 478     # MediaPipe with refine_landmarks=True
+
+# Shared-memory landmark slot: row 0 = [count, 0, 0], rows 1..count = (x, y, z)
+RESULT_SHAPE = (MAX_LANDMARKS + 1, 3)
+RESULT_BYTES = int(np.prod(RESULT_SHAPE)) * 4  # float32
+
+
+def onnx_available(*model_paths):
+    return ort is not None and all(os.path.exists(p) for p in model_paths)
+
+
+def create_face_mesh(detector_path, landmark_path,
+                     min_detection_confidence=0.5, min_tracking_confidence=0.5):
+    # ONNX Runtime when both exported models are present, stock MediaPipe otherwise
+    if onnx_available(detector_path, landmark_path):
+        return OnnxFaceMesh(detector_path, landmark_path,
+                            min_detection_confidence=min_detection_confidence,
+                            min_tracking_confidence=min_tracking_confidence)
+    return mp.solutions.face_mesh.FaceMesh(
+        max_num_faces=1,
+        refine_landmarks=True,
+        min_detection_confidence=min_detection_confidence,
+        min_tracking_confidence=min_tracking_confidence
+    )
+
+
+def first_face(results):
+    # FaceMesh results -> (N,3) normalized landmark array of the first face, or None
+    if not results.multi_face_landmarks:
+        return None
+    lm = results.multi_face_landmarks[0].landmark
+    return np.array([(p.x, p.y, p.z) for p in lm], dtype=np.float32)
+
+
+def provider_name(provider):
+    # Providers are either a name or a (name, options) pair
+    return provider if isinstance(provider, str) else provider[0]
+
+
+def create_session(path, providers=PROVIDERS):
+    so = ort.SessionOptions()
+    so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    so.intra_op_num_threads = os.cpu_count()
+    available = ort.get_available_providers()
+    providers = [p for p in providers if provider_name(p) in available]
+    return ort.InferenceSession(path, sess_options=so, providers=providers)
+
+
+# --- Dynamic Batch Export ---
+def make_batch_dynamic(path):
+    # tf2onnx keeps the TFLite batch of 1: name dim 0 of the graph inputs/outputs "N" and let the
+    # Reshape targets copy the batch (0) instead of hardcoding 1, so replay can batch frames
+    import onnx
+    from onnx import numpy_helper
+    model = onnx.load(path)
+    graph = model.graph
+    for value in list(graph.input) + list(graph.output):
+        value.type.tensor_type.shape.dim[0].dim_param = "N"
+    del graph.value_info[:]  # Stale batch-1 shapes, re-inferred by ONNX Runtime
+    initializers = {t.name: t for t in graph.initializer}
+    for node in graph.node:
+        target = initializers.get(node.input[1]) if node.op_type == "Reshape" else None
+        if target is not None:
+            shape = numpy_helper.to_array(target).copy()
+            if shape[0] == 1:
+                shape[0] = 0
+                target.CopyFrom(numpy_helper.from_array(shape, target.name))
+    onnx.save(model, path)
+
+
+# --- INT8 Landmark Model ---
+def int8_path(path):
+    # models/face_landmark.onnx -> models/face_landmark.int8.onnx
+    root, ext = os.path.splitext(path)
+    return f"{root}.int8{ext}"
+
+
+def int8_pass_path(path):
+    # Written by a passing --validate-int8 run, OnnxFaceMesh only loads a validated INT8 model
+    return f"{int8_path(path)}.pass"
+
+
+def quantize_landmark_model(path):
+    # Dynamic INT8 weights (activations quantized at runtime), unvalidated until --validate-int8 passes
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    quantize_dynamic(path, int8_path(path), weight_type=QuantType.QInt8)
+    record_int8_validation(path, None)
+    return int8_path(path)
+
+
+def record_int8_validation(path, passed):
+    # passed=None/False drops any earlier pass, a fresh or failing model is never picked up
+    if passed:
+        with open(int8_pass_path(path), "w") as f:
+            f.write(f"{passed}\n")
+    elif os.path.exists(int8_pass_path(path)):
+        os.remove(int8_pass_path(path))
+
+
+def use_int8(path):
+    # Validated INT8 model, and only where there is no CUDA device it would move inference off
+    return (os.path.exists(int8_path(path)) and os.path.exists(int8_pass_path(path))
+            and "CUDAExecutionProvider" not in ort.get_available_providers())
+
+
+def blazeface_anchors():
+    # 16x16 grid x 2 anchors (stride 8) + 8x8 grid x 6 anchors (stride 16) = 896
+    anchors = []
+    for stride, per_cell in ((8, 2), (16, 6)):
+        grid = DETECTOR_SIZE // stride
+        for y in range(grid):
+            for x in range(grid):
+                anchors += [((x + 0.5) / grid, (y + 0.5) / grid)] * per_cell
+    return np.array(anchors, dtype=np.float32)
+
+
+def sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-np.clip(x, -80, 80)))
+
+
+class OnnxFaceMesh:
+    def __init__(self, detector_path, landmark_path,
+                 min_detection_confidence=0.5, min_tracking_confidence=0.5, int8=None):
+        # int8: None = validated INT8 model on CPU-only machines, True/False = force on/off
+        self.detector = create_session(detector_path)
+        if use_int8(landmark_path) if int8 is None else int8:
+            # Dynamic INT8 kernels (VNNI) live on the CPU EP
+            self.landmarker = create_session(int8_path(landmark_path), providers=("CPUExecutionProvider",))
+        else:
+            self.landmarker = create_session(landmark_path)
+        self.min_detection_confidence = min_detection_confidence
+        self.min_tracking_confidence = min_tracking_confidence
+        self.anchors = blazeface_anchors()
+        self.roi = None  # Last face ROI (cx, cy, side) in pixels, reused across frames
+        self.device_inputs = {}  # Session -> preallocated CUDA input OrtValue
+
+    # --- Session Helpers ---
+    def _run(self, session, tensor):
+        inp = session.get_inputs()[0]
+        if inp.shape[0] == 1 and len(tensor) > 1:
+            # Fixed batch-1 export: fall back to one call per frame
+            outputs = [self._run(session, t[np.newaxis]) for t in tensor]
+            return [np.concatenate(o) for o in zip(*outputs)]
+        if inp.shape[1] == 3:  # NCHW export
+            tensor = tensor.transpose(0, 3, 1, 2)
+        tensor = np.ascontiguousarray(tensor)
+
+        if session.get_providers()[0] == "CUDAExecutionProvider":
+            # IO-Binding: upload into a preallocated device tensor, outputs stay on-device until the final copy back
+            binding = session.io_binding()
+            binding.bind_ortvalue_input(inp.name, self._device_input(session, tensor))
+            for out in session.get_outputs():
+                binding.bind_output(out.name, "cuda")
+            session.run_with_iobinding(binding)
+            return binding.copy_outputs_to_cpu()
+        return session.run(None, {inp.name: tensor})
+
+    def _device_input(self, session, tensor):
+        # Reallocated only when the batch shape changes (replay tail batches)
+        value = self.device_inputs.get(session)
+        if value is None or value.shape() != list(tensor.shape):
+            value = ort.OrtValue.ortvalue_from_shape_and_type(tensor.shape, np.float32, "cuda", 0)
+            self.device_inputs[session] = value
+        value.update_inplace(tensor)
+        return value
+
+    def warmup(self, batch_sizes=(1,), runs=WARMUP_RUNS):
+        # The first CUDA calls pay for cuDNN setup and allocator growth, per input shape,
+        # so every batch size the caller will run gets warmed before the mission loop
+        for session, size in ((self.detector, DETECTOR_SIZE), (self.landmarker, LANDMARK_SIZE)):
+            for batch in batch_sizes:
+                if batch > 1 and session.get_inputs()[0].shape[0] == 1:
+                    continue  # Fixed batch-1 export, batches run one frame per call anyway
+                dummy = np.zeros((batch, size, size, 3), dtype=np.float32)
+                for _ in range(runs):
+                    self._run(session, dummy)
+
+    @staticmethod
+    def _crop(image, roi, size):
+        # Square crop around (cx, cy) resized to size x size, zero padded at the edges
+        cx, cy, side = roi
+        s = size / side
+        m = np.array([[s, 0, size / 2 - s * cx],
+                      [0, s, size / 2 - s * cy]], dtype=np.float32)
+        return cv2.warpAffine(image, m, (size, size), flags=cv2.INTER_LINEAR,
+                              borderMode=cv2.BORDER_CONSTANT)
+
+    @staticmethod
+    def _to_tensor(crops, scale, offset, bgr):
+        # Channel swap + normalize in a single pass over the (small) crops
+        src = crops[..., ::-1] if bgr else crops
+        tensor = np.empty(crops.shape, dtype=np.float32)
+        np.multiply(src, np.float32(scale), out=tensor)
+        if offset:
+            tensor += np.float32(offset)
+        return tensor
+
+    # --- Stage 1: Face Detection (BlazeFace) ---
+    def _detect(self, images, bgr):
+        n, h, w, _ = images.shape
+        frame_roi = (w / 2, h / 2, max(w, h))  # Letterboxed full frame
+        crops = np.stack([self._crop(img, frame_roi, DETECTOR_SIZE) for img in images])
+        tensor = self._to_tensor(crops, 1 / 127.5, -1.0, bgr)
+
+        outputs = self._run(self.detector, tensor)
+        regressors = next(o for o in outputs if o.shape[-1] == 16)
+        scores = sigmoid(next(o for o in outputs if o.shape[-1] == 1).reshape(n, -1))
+
+        rois = []
+        cx, cy, side = frame_roi
+        for reg, score in zip(regressors, scores):
+            best = int(np.argmax(score))
+            if score[best] < self.min_detection_confidence:
+                rois.append(None)
+                continue
+            x, y, bw, bh = reg[best, :4] / DETECTOR_SIZE
+            x += self.anchors[best, 0]
+            y += self.anchors[best, 1]
+            rois.append((cx + (x - 0.5) * side,
+                         cy + (y - 0.5) * side,
+                         max(bw, bh) * side * ROI_SCALE))
+        return rois
+
+    # --- Stage 2: Landmarks (FaceMesh) ---
+    def _landmarks(self, images, rois, bgr):
+        n, h, w, _ = images.shape
+        crops = np.stack([self._crop(img, roi, LANDMARK_SIZE) for img, roi in zip(images, rois)])
+        tensor = self._to_tensor(crops, 1 / 255.0, 0.0, bgr)
+
+        outputs = self._run(self.landmarker, tensor)
+        points = next(o for o in outputs if o.size == n * NUM_LANDMARKS * 3)
+        presence = sigmoid(next(o for o in outputs if o.size == n).reshape(n))
+
+        # Crop pixels -> normalized full-frame coordinates
+        roi = np.array(rois, dtype=np.float32)
+        cx, cy, side = roi[:, 0:1], roi[:, 1:2], roi[:, 2:3]
+        pts = points.reshape(n, NUM_LANDMARKS, 3).astype(np.float32) / LANDMARK_SIZE
+        pts[:, :, 0] = (cx + (pts[:, :, 0] - 0.5) * side) / w
+        pts[:, :, 1] = (cy + (pts[:, :, 1] - 0.5) * side) / h
+        pts[:, :, 2] *= side / w
+        return pts, presence
+
+    @staticmethod
+    def _roi_from_landmarks(pts, w, h):
+        x, y = pts[:, 0] * w, pts[:, 1] * h
+        side = max(x.max() - x.min(), y.max() - y.min()) * ROI_SCALE
+        return ((x.max() + x.min()) / 2, (y.max() + y.min()) / 2, side)
+
+    def track(self, image, bgr=False):
+        # (468,3) normalized landmarks of the tracked face, or None
+        # bgr=True skips the caller's full-frame cvtColor; channels are swapped on the crop
+        h, w, _ = image.shape
+        images = image[np.newaxis]
+
+        # Only rerun the detector when there is no tracked face
+        if self.roi is None:
+            self.roi = self._detect(images, bgr)[0]
+            if self.roi is None:
+                return None
+
+        pts, presence = self._landmarks(images, [self.roi], bgr)
+        if presence[0] < self.min_tracking_confidence:
+            self.roi = None  # Face lost, redetect next frame
+            return None
+        self.roi = self._roi_from_landmarks(pts[0], w, h)
+        return pts[0]
+
+    def process_batch(self, frames, bgr=False):
+        # Replay mode: (N,H,W,3) frames, detector + landmarks each run as one batched call
+        # Returns one (468,3) landmark array (or None) per frame
+        frames = np.asarray(frames)
+        rois = self._detect(frames, bgr)
+        found = [i for i, roi in enumerate(rois) if roi is not None]
+
+        landmarks = [None] * len(frames)
+        if found:
+            pts, presence = self._landmarks(frames[found], [rois[i] for i in found], bgr)
+            for i, face_pts, score in zip(found, pts, presence):
+                if score >= self.min_tracking_confidence:
+                    landmarks[i] = face_pts
+        return landmarks
+
+
+# ==========================================
+#        INFERENCE WORKER PROCESS
+# ==========================================
+# Frames arrive in a shared-memory buffer (BGR for ONNX, RGB for MediaPipe),
+# landmarks go back through a second one. Two semaphores hand the buffers
+# back and forth, so no frame is ever pickled.
+def inference_worker(frame_shm_name, result_shm_name, frame_shape,
+                     frame_ready, result_ready, worker_ready, stop_event, detector_path, landmark_path):
+    frame_shm = shared_memory.SharedMemory(name=frame_shm_name)
+    result_shm = shared_memory.SharedMemory(name=result_shm_name)
+    frame = np.ndarray(frame_shape, dtype=np.uint8, buffer=frame_shm.buf)
+    result = np.ndarray(RESULT_SHAPE, dtype=np.float32, buffer=result_shm.buf)
+
+    face_mesh = create_face_mesh(detector_path, landmark_path)
+    use_onnx = isinstance(face_mesh, OnnxFaceMesh)
+    if use_onnx:
+        face_mesh.warmup()
+    worker_ready.set()
+    try:
+        while True:
+            frame_ready.acquire()
+            if stop_event.is_set():
+                break
+
+            if use_onnx:
+                pts = face_mesh.track(frame, bgr=True)
+            else:
+                pts = first_face(face_mesh.process(frame))
+
+            n = 0 if pts is None else len(pts)
+            result[0, 0] = n
+            if n:
+                result[1:n + 1] = pts
+            result_ready.release()
+    finally:
+        del frame, result  # Views must go before the segments can close
+        frame_shm.close()
+        result_shm.close()